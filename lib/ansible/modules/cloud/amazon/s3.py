@@ -56,6 +56,13 @@ options:
     required: false
     default: no
     version_added: "2.0"
+  etag_cache_dir:
+    description:
+      - Directory caching the MD5 sums and multipart etags of local files compared with objects when overwrite is C(different) or C(never), so that an unchanged file is not hashed again on the next run. An entry is reused while the file's size, inode and modification and change times are unchanged, and entries not owned by the user running the module are ignored.
+      - The cache is disabled when this is not set.
+    required: false
+    default: null
+    version_added: "2.3"
   expiration:
     description:
       - Time limit (in seconds) for the URL generated and returned by S3/Walrus when performing a mode=put or mode=geturl operation.
@@ -251,7 +258,19 @@ EXAMPLES = '''
     mode: delobj
 '''
 
+import atexit
+import binascii
+import email.utils
+import hashlib
+import json
+import mimetypes
+import mmap
 import os
+import sys
+import tempfile
+from multiprocessing.pool import ThreadPool
+from ansible.module_utils._text import to_bytes
+from ansible.module_utils.six import reraise, string_types
 from ansible.module_utils.six.moves.urllib.parse import urlparse
 from ssl import SSLError
 
@@ -266,40 +285,338 @@ try:
 except ImportError:
     HAS_BOTO = False
 
-def key_check(module, s3, bucket, obj, version=None):
+MIB = 1024 * 1024
+
+# Block size used when a local file cannot be memory mapped for hashing.
+DIGEST_BLOCKSIZE = 8 * MIB
+
+# Files larger than MULTIPART_THRESHOLD are uploaded as a multipart upload and
+# downloaded as byte-range GETs, with up to TRANSFER_THREADS parts of
+# MULTIPART_CHUNKSIZE in flight at once.
+MULTIPART_THRESHOLD = 64 * MIB
+MULTIPART_CHUNKSIZE = 64 * MIB
+# S3 refuses multipart uploads made of more parts than this.
+MULTIPART_MAX_PARTS = 10000
+# Part sizes commonly used by other S3 clients, tried when comparing a local
+# file against a multipart etag.
+MULTIPART_ETAG_CHUNKSIZES = [8 * MIB, 5 * MIB, 15 * MIB, 16 * MIB, 32 * MIB, 128 * MIB]
+# Transfer threads share the module's single S3 connection; its pool hands
+# each thread a kept-alive HTTP(S) connection that later parts reuse.
+TRANSFER_THREADS = 8
+
+# Keys removed per multi-object delete request (the S3 maximum), with up to
+# DELETE_THREADS requests running while the bucket listing continues.
+DELETE_BATCH_SIZE = 1000
+DELETE_THREADS = 4
+
+def new_md5():
+    # The digest is only compared with S3 etags, flagging it as not used for
+    # security keeps it available (and off the slow path) on FIPS builds.
     try:
-        bucket = s3.lookup(bucket)
-        key_check = bucket.get_key(obj, version_id=version)
-    except s3.provider.storage_response_error as e:
-        if version is not None and e.status == 400: # If a specified version doesn't exist a 400 is returned.
-            key_check = None
+        return hashlib.new('md5', usedforsecurity=False)
+    except TypeError:
+        return hashlib.md5()
+
+def fadvise(f, advice, offset=0, length=0):
+    """ Give the kernel advice ('SEQUENTIAL', 'DONTNEED') about how f is used, where os.posix_fadvise exists
+
+    Local files are read from start to end, to compare them and then maybe to
+    upload them. DONTNEED is only given after the last of those reads, as the
+    upload benefits from the pages the comparison brought in."""
+    advice = getattr(os, 'POSIX_FADV_' + advice, None)
+    if advice is not None:
+        try:
+            os.posix_fadvise(f.fileno(), offset, length, advice)
+        except EnvironmentError:
+            pass
+
+def get_md5_digest(local_file):
+    """ Return the MD5 hex digest of local_file
+
+    On Python 3.11+ hashlib.file_digest() streams the file through a reused
+    buffer. Elsewhere the file is memory mapped so hashlib can digest it in a
+    single call, and files that cannot be mapped (empty files, exhausted
+    address space on 32-bit hosts) are read in large blocks instead."""
+    f = open(local_file, 'rb')
+    fadvise(f, 'SEQUENTIAL')
+    try:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, new_md5).hexdigest()
+        md5 = new_md5()
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError, OverflowError):
+            mm = None
+        if mm is not None:
+            try:
+                md5.update(mm)
+            finally:
+                mm.close()
         else:
-            module.fail_json(msg=str(e))
-    if key_check:
-        return True
-    else:
-        return False
+            block = f.read(DIGEST_BLOCKSIZE)
+            while block:
+                md5.update(block)
+                block = f.read(DIGEST_BLOCKSIZE)
+    finally:
+        f.close()
+    return md5.hexdigest()
+
+def drop_page_cache(local_file):
+    """ Advise the kernel that local_file is not read again, once a comparison ends the run """
+    try:
+        f = open(local_file, 'rb')
+    except EnvironmentError:
+        return
+    try:
+        fadvise(f, 'DONTNEED')
+    finally:
+        f.close()
 
-def keysum(module, s3, bucket, obj, version=None):
-    bucket = s3.lookup(bucket)
-    key_check = bucket.get_key(obj, version_id=version)
-    if not key_check:
-        return None
-    md5_remote = key_check.etag[1:-1]
-    etag_multipart = '-' in md5_remote # Check for multipart, etag is not md5
-    if etag_multipart is True:
-        module.fail_json(msg="Files uploaded with multipart of s3 are not supported with checksum, unable to compute checksum.")
-    return md5_remote
+def stat_signature(st):
+    """ Return the (mtime, ctime, inode, size) of a stat result, which changes whenever the file does """
+    return (getattr(st, 'st_mtime_ns', st.st_mtime), getattr(st, 'st_ctime_ns', st.st_ctime), st.st_ino, st.st_size)
+
+def etag_cache_file(cache_dir, path):
+    """ Return the file of cache_dir holding the etag cached for the local file path """
+    return os.path.join(cache_dir, hashlib.sha1(to_bytes(os.path.realpath(path), errors='surrogate_or_strict')).hexdigest())
 
-def bucket_check(module, s3, bucket):
+def load_etag_cache(cache_dir, path):
+    """ Return the (mtime, ctime, inode, size, etags) saved for path by save_etag_cache, or None
+
+    etags holds the plain MD5 etag and the multipart etag of path, whichever
+    of them were computed. cache_dir may be shared with other users, only entries owned by the
+    running user are trusted."""
+    if not cache_dir:
+        return None
     try:
-        result = s3.lookup(bucket)
-    except s3.provider.storage_response_error as e:
-        module.fail_json(msg= str(e))
-    if result:
-        return True
-    else:
+        f = open(etag_cache_file(cache_dir, path), 'r')
+        try:
+            if os.fstat(f.fileno()).st_uid != os.getuid():
+                return None
+            entry = json.load(f)
+        finally:
+            f.close()
+        mtime, ctime, ino, size = entry[:4]
+        etags = entry[4:]
+    except (EnvironmentError, ValueError, TypeError):
+        return None
+    if not etags or [etag for etag in etags if not isinstance(etag, string_types)]:
+        return None
+    return (mtime, ctime, ino, size, etags)
+
+def save_etag_cache(cache_dir, path, etag, signature):
+    """ Cache etag for path, signature being the stat_signature of path taken before etag was computed
+
+    Nothing is cached if path changed since, the etag may not match what it
+    holds now. An etag of the other kind (plain MD5 or multipart) cached for
+    the same content is kept, a file compared with both kinds of remote etag
+    would otherwise never find the one it needs."""
+    if not cache_dir:
+        return
+    if stat_signature(os.stat(path)) != signature:
+        return
+    etags = [etag]
+    cached = load_etag_cache(cache_dir, path)
+    if cached and cached[:4] == tuple(signature):
+        etags.extend(e for e in cached[4] if ('-' in e) != ('-' in etag))
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        # The entry is written to a private temporary file and renamed into
+        # place, which never follows a link planted under the entry's name.
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir)
+        try:
+            f = os.fdopen(fd, 'w')
+            try:
+                json.dump(list(signature) + etags, f)
+            finally:
+                f.close()
+            os.rename(tmp_file, etag_cache_file(cache_dir, path))
+        except EnvironmentError:
+            os.remove(tmp_file)
+            raise
+    except EnvironmentError:
+        # the cache only saves rehashing, it is fine to go without it.
+        pass
+
+def clear_etag_cache(cache_dir, path):
+    if not cache_dir:
+        return
+    try:
+        os.remove(etag_cache_file(cache_dir, path))
+    except EnvironmentError:
+        pass
+
+def get_cached_etags(cache_dir, local_file):
+    """ Return the etags cached for local_file, an empty list if there are none or the file changed since """
+    cached = load_etag_cache(cache_dir, local_file)
+    if cached and cached[:4] == stat_signature(os.stat(local_file)):
+        return cached[4]
+    return []
+
+def cached_md5_digest(local_file, cache_dir=None):
+    """ Return the MD5 hex digest of local_file, reusing the one cached in cache_dir if the file is unchanged """
+    for md5_local in get_cached_etags(cache_dir, local_file):
+        if '-' not in md5_local:
+            return md5_local
+    signature = stat_signature(os.stat(local_file))
+    md5_local = get_md5_digest(local_file)
+    save_etag_cache(cache_dir, local_file, md5_local, signature)
+    return md5_local
+
+class MultipartEtag(object):
+    """ Incrementally compute the etag S3 gives data uploaded in parts of chunk_size """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.digests = []
+        self.md5 = new_md5()
+        self.part_size = 0
+
+    def update(self, data):
+        # Slicing a memoryview shares the data instead of copying it, there is
+        # no memoryview before Python 2.7.
+        try:
+            view = memoryview(data)
+        except NameError:
+            view = data
+        offset = 0
+        while offset < len(data):
+            size = min(self.chunk_size - self.part_size, len(data) - offset)
+            self.md5.update(view[offset:offset + size])
+            self.part_size += size
+            offset += size
+            if self.part_size == self.chunk_size:
+                self.digests.append(self.md5.digest())
+                self.md5 = new_md5()
+                self.part_size = 0
+
+    def hexdigest(self):
+        digests = self.digests
+        if self.part_size:
+            digests = digests + [self.md5.digest()]
+        md5 = new_md5()
+        md5.update(b''.join(digests))
+        return '%s-%d' % (md5.hexdigest(), len(digests))
+
+def get_multipart_etags(local_file, chunk_sizes):
+    """ Return a dict of the etag S3 gives local_file when uploaded in parts of each of chunk_sizes
+
+    The file is read once, every block feeding the part digests of all chunk sizes."""
+    hashers = [MultipartEtag(chunk_size) for chunk_size in chunk_sizes]
+    f = open(local_file, 'rb')
+    fadvise(f, 'SEQUENTIAL')
+    try:
+        block = f.read(DIGEST_BLOCKSIZE)
+        while block:
+            for hasher in hashers:
+                hasher.update(block)
+            block = f.read(DIGEST_BLOCKSIZE)
+    finally:
+        f.close()
+    return dict((hasher.chunk_size, hasher.hexdigest()) for hasher in hashers)
+
+def start_md5_digest(local_file, cache_dir=None):
+    """ Start computing the MD5 hex digest of local_file in the background, returning its AsyncResult """
+    pool = ThreadPool(1)
+    result = pool.apply_async(cached_md5_digest, (local_file, cache_dir))
+    pool.close()
+    # The module may exit before the digest is used, wait for the worker then.
+    atexit.register(pool.join)
+    return result
+
+def local_etag(local_file, remote_etag, pending_md5=None, cache_dir=None):
+    """ Return the etag of local_file computed the same way as remote_etag
+
+    A multipart etag depends on the part size used for the upload, which S3
+    does not report. The part sizes that give the same number of parts are
+    hashed in a single pass over the file, among them the ones this module and
+    common clients use. None is returned when none of them reproduces
+    remote_etag. pending_md5 is an MD5 digest already started by
+    start_md5_digest, and cache_dir the etag cache directory, if any."""
+    if '-' not in remote_etag:
+        if pending_md5 is not None:
+            return pending_md5.get()
+        return cached_md5_digest(local_file, cache_dir)
+
+    if remote_etag in get_cached_etags(cache_dir, local_file):
+        return remote_etag
+
+    st = os.stat(local_file)
+    signature = stat_signature(st)
+    chunk_sizes = multipart_chunk_sizes(st.st_size, remote_etag)
+    if not chunk_sizes:
+        return None
+    for etag in get_multipart_etags(local_file, chunk_sizes).values():
+        if etag == remote_etag:
+            # let the MD5 started ahead save its entry first, or the two
+            # updates could each drop the other's etag.
+            if pending_md5 is not None:
+                pending_md5.wait()
+            save_etag_cache(cache_dir, local_file, etag, signature)
+            return etag
+    return None
+
+def multipart_chunk_sizes(size, remote_etag):
+    """ Return the part sizes that split size bytes into as many parts as remote_etag reports """
+    try:
+        parts = int(remote_etag.split('-')[-1])
+    except ValueError:
+        return []
+    candidates = [max(MULTIPART_CHUNKSIZE, -(-size // MULTIPART_MAX_PARTS))] + MULTIPART_ETAG_CHUNKSIZES
+    if size and parts > 1:
+        # the smallest whole MiB part size that splits the file into that many parts
+        candidates.append(-(-size // parts // MIB) * MIB)
+
+    # Part sizes at least as large as the file all give the same single part,
+    # only the first of the part sizes splitting the file alike is hashed.
+    chunk_sizes = []
+    first_parts = set()
+    for chunk_size in candidates:
+        if min(chunk_size, size) not in first_parts and -(-size // chunk_size) == parts:
+            first_parts.add(min(chunk_size, size))
+            chunk_sizes.append(chunk_size)
+    return chunk_sizes
+
+def bucket_and_key_check(module, s3, bucket, obj=None, version=None):
+    """ Return (bucket object, key object, bucket region) for bucket and obj
+
+    The bucket or key object is None if it does not exist, the region is only
+    given for a bucket that could not be found on this connection. Looking the
+    key up is a single HEAD Object request that also proves the bucket exists,
+    only a missing key needs a HEAD Bucket to tell the two cases apart."""
+    # Nothing is memoized here: a run checks each bucket once, or twice when
+    # it reconnects to the bucket's region, get_bucket(validate=False) sends
+    # no request, and a cache would only have to follow create and delete.
+    bucket_obj = s3.get_bucket(bucket, validate=False)
+    key = None
+    if obj is not None:
+        try:
+            key = bucket_obj.get_key(obj, version_id=version)
+        except s3.provider.storage_response_error as e:
+            if version is not None and e.status == 400: # If a specified version doesn't exist a 400 is returned.
+                key = None
+            elif e.status == 301: # The bucket lives in another region, the HEAD Bucket below tells which.
+                key = None
+            else:
+                module.fail_json(msg=str(e))
+        if key is not None:
+            return bucket_obj, key, None
+    status, region = head_bucket(s3, bucket)
+    if status == 200:
+        return bucket_obj, None, None
+    return None, None, region
+
+def keysum(key):
+    return key.etag[1:-1]
+
+def compare_local(key, local_file, pending_md5=None, cache_dir=None):
+    """ Return True if local_file has the same etag as key, see local_etag for pending_md5 and cache_dir """
+    # A file of another size cannot match, only hash it when the sizes agree.
+    if key.size != os.path.getsize(local_file):
         return False
+    md5_remote = keysum(key)
+    return local_etag(local_file, md5_remote, pending_md5, cache_dir) == md5_remote
 
 def create_bucket(module, s3, bucket, location=None):
     if location is None:
@@ -310,14 +627,28 @@ def create_bucket(module, s3, bucket, location=None):
             bucket.set_acl(acl)
     except s3.provider.storage_response_error as e:
         module.fail_json(msg= str(e))
-    if bucket:
-        return True
+    return bucket
 
-def get_bucket(module, s3, bucket):
-    try:
-        return s3.lookup(bucket)
-    except s3.provider.storage_response_error as e:
-        module.fail_json(msg= str(e))
+def head_bucket(s3, bucket):
+    """ Return the HTTP status of a HEAD Bucket request and the region S3 reports for bucket, or None
+
+    This is the request s3.lookup() sends, but lookup() turns every failure
+    into None and drops the x-amz-bucket-region header of a bucket living in
+    another region."""
+    response = s3.make_request('HEAD', bucket)
+    response.read()
+    return response.status, response.getheader('x-amz-bucket-region')
+
+def reconnect_location(location, bucket_region, s3_url=None):
+    """ Return the location to reconnect to for a bucket S3 reported in bucket_region, or None to keep location
+
+    Only AWS reports the region of a bucket, there is nothing to reconnect to
+    with s3_url set or when the bucket is in the connected region."""
+    if s3_url or not bucket_region or bucket_region == (location or 'us-east-1'):
+        return None
+    if bucket_region == 'us-east-1':
+        return Location.DEFAULT
+    return bucket_region
 
 def list_keys(module, bucket_object, prefix, marker, max_keys):
     all_keys = bucket_object.get_all_keys(prefix=prefix, marker=marker, max_keys=max_keys)
@@ -328,9 +659,26 @@ def list_keys(module, bucket_object, prefix, marker, max_keys):
 
 def delete_bucket(module, s3, bucket):
     try:
-        bucket = s3.lookup(bucket)
-        bucket_contents = bucket.list()
-        bucket.delete_keys([key.name for key in bucket_contents])
+        # Delete the keys in batches while the listing pages through the
+        # bucket, keeping at most a few batches of key names in memory.
+        pool = ThreadPool(DELETE_THREADS)
+        try:
+            pending = []
+            batch = []
+            for key in bucket.list():
+                batch.append(key.name)
+                if len(batch) == DELETE_BATCH_SIZE:
+                    pending.append(pool.apply_async(bucket.delete_keys, (batch,)))
+                    batch = []
+                    if len(pending) > DELETE_THREADS:
+                        pending.pop(0).get()
+            if batch:
+                pending.append(pool.apply_async(bucket.delete_keys, (batch,)))
+            for result in pending:
+                result.get()
+        finally:
+            pool.close()
+            pool.join()
         bucket.delete()
         return True
     except s3.provider.storage_response_error as e:
@@ -338,52 +686,192 @@ def delete_bucket(module, s3, bucket):
 
 def delete_key(module, s3, bucket, obj):
     try:
-        bucket = s3.lookup(bucket)
+        # A single DELETE Object request. delete_keys() would not save a round
+        # trip, reports failures only in its result and is missing from some
+        # S3 compatible stores.
         bucket.delete_key(obj)
-        module.exit_json(msg="Object deleted from bucket %s"%bucket, changed=True)
+        module.exit_json(msg="Object deleted from bucket %s"%bucket.name, changed=True)
     except s3.provider.storage_response_error as e:
         module.fail_json(msg= str(e))
 
-def create_dirkey(module, s3, bucket, obj):
+def create_dirkey(module, s3, bucket, obj, fail_on_error=True):
     try:
-        bucket = s3.lookup(bucket)
         key = bucket.new_key(obj)
-        key.set_contents_from_string('')
+        # If-None-Match makes S3 refuse to replace an existing key, so this one
+        # request both creates the key and tells whether it was already there.
+        key.set_contents_from_string('', headers={'If-None-Match': '*'})
         module.exit_json(msg="Virtual directory %s created in bucket %s" % (obj, bucket.name), changed=True)
     except s3.provider.storage_response_error as e:
-        module.fail_json(msg= str(e))
+        if e.status == 412:
+            module.exit_json(msg="Bucket %s and key %s already exists."% (bucket.name, obj), changed=False)
+        if fail_on_error:
+            module.fail_json(msg= str(e))
 
-def path_check(path):
-    if os.path.exists(path):
-        return True
-    else:
-        return False
 
+def upload_part(mp, src, part_num, offset, size):
+    fp = open(src, 'rb')
+    fadvise(fp, 'SEQUENTIAL', offset, size)
+    try:
+        fp.seek(offset)
+        mp.upload_part_from_file(fp, part_num, size=size)
+    finally:
+        fadvise(fp, 'DONTNEED', offset, size)
+        fp.close()
+
+def multipart_upload(bucket, obj, src, metadata, encrypt, headers):
+    size = os.path.getsize(src)
+    chunk_size = max(MULTIPART_CHUNKSIZE, -(-size // MULTIPART_MAX_PARTS))
+    parts = []
+    for part_num, offset in enumerate(range(0, size, chunk_size)):
+        parts.append((part_num + 1, offset, min(chunk_size, size - offset)))
+
+    # A single PUT guesses the content type from the file name, do the same here.
+    headers = dict(headers or {})
+    if not [h for h in list(headers) + list(metadata or {}) if h.lower() == 'content-type']:
+        content_type = mimetypes.guess_type(src)[0]
+        if content_type:
+            headers['Content-Type'] = content_type
+
+    mp = bucket.initiate_multipart_upload(obj, headers=headers, metadata=metadata, encrypt_key=encrypt)
+    pool = ThreadPool(min(TRANSFER_THREADS, len(parts)))
+    try:
+        try:
+            pool.map(lambda part: upload_part(mp, src, *part), parts)
+            mp.complete_upload()
+        except Exception:
+            # a failed cancel must not hide the error that caused it.
+            exc_info = sys.exc_info()
+            try:
+                mp.cancel_upload()
+            except Exception:
+                pass
+            reraise(*exc_info)
+    finally:
+        pool.close()
+        pool.join()
 
 def upload_s3file(module, s3, bucket, obj, src, expiry, metadata, encrypt, headers):
     try:
-        bucket = s3.lookup(bucket)
         key = bucket.new_key(obj)
-        if metadata:
-            for meta_key in metadata.keys():
-                key.set_metadata(meta_key, metadata[meta_key])
-
-        key.set_contents_from_filename(src, encrypt_key=encrypt, headers=headers)
+        if os.path.getsize(src) > MULTIPART_THRESHOLD:
+            multipart_upload(bucket, obj, src, metadata, encrypt, headers)
+        else:
+            if metadata:
+                # not key.update_metadata(): set_metadata() also fixes the case of
+                # Content-Type and Content-MD5, which request signing relies on.
+                for meta_key, meta_value in metadata.items():
+                    key.set_metadata(meta_key, meta_value)
+
+            fp = open(src, 'rb')
+            fadvise(fp, 'SEQUENTIAL')
+            try:
+                key.set_contents_from_file(fp, encrypt_key=encrypt, headers=headers)
+            finally:
+                fadvise(fp, 'DONTNEED')
+                fp.close()
         for acl in module.params.get('permission'):
             key.set_acl(acl)
         url = key.generate_url(expiry)
         module.exit_json(msg="PUT operation complete", url=url, changed=True)
-    except s3.provider.storage_copy_error as e:
+    except (s3.provider.storage_copy_error, s3.provider.storage_response_error) as e:
         module.fail_json(msg= str(e))
 
-def download_s3file(module, s3, bucket, obj, dest, retries, version=None):
+def download_part(bucket, obj, etag, dest, offset, size, retries, version=None):
+    # Pin the range to the etag seen up front, so an object overwritten while
+    # downloading fails the transfer instead of mixing two versions.
+    headers = {'Range': 'bytes=%d-%d' % (offset, offset + size - 1), 'If-Match': etag}
+    for x in range(0, retries + 1):
+        key = bucket.new_key(obj)
+        fp = open(dest, 'r+b')
+        try:
+            fp.seek(offset)
+            key.get_contents_to_file(fp, headers=headers, version_id=version)
+            fp.flush()
+            # pages still dirty are kept, the ones already written back go.
+            fadvise(fp, 'DONTNEED', offset, size)
+            return
+        except SSLError:
+            # retry just this range, the others are unaffected.
+            if x >= retries:
+                raise
+        finally:
+            fp.close()
+
+def mkstemp_beside(dest):
+    """ Return the real path of dest, and the descriptor and name of a new temporary file in its directory
+
+    A symlinked dest gets its target replaced, as writing to dest would go
+    through the link."""
+    real_dest = os.path.realpath(dest)
+    fd, tmp_dest = tempfile.mkstemp(prefix='.%s.' % os.path.basename(real_dest), dir=os.path.dirname(real_dest))
+    return real_dest, fd, tmp_dest
+
+def multipart_download(module, bucket, key, dest, retries, version=None):
+    parts = []
+    for offset in range(0, key.size, MULTIPART_CHUNKSIZE):
+        parts.append((offset, min(MULTIPART_CHUNKSIZE, key.size - offset)))
+
+    # The ranges land in a temporary file next to dest, which only replaces
+    # dest once every range is in. A failed transfer leaves dest untouched.
+    real_dest, fd, tmp_dest = mkstemp_beside(dest)
+    try:
+        try:
+            os.ftruncate(fd, key.size)
+        finally:
+            os.close(fd)
+
+        pool = ThreadPool(min(TRANSFER_THREADS, len(parts)))
+        try:
+            pool.map(lambda part: download_part(bucket, key.name, key.etag, tmp_dest, part[0], part[1], retries, version=version), parts)
+        finally:
+            pool.close()
+            pool.join()
+
+        set_last_modified(tmp_dest, key)
+        module.atomic_move(tmp_dest, real_dest)
+    finally:
+        if os.path.exists(tmp_dest):
+            os.remove(tmp_dest)
+
+def set_last_modified(path, key):
+    """ Set the mtime of path to the key's Last-Modified, as boto does for single stream downloads """
+    if key.last_modified is not None:
+        try:
+            modified_stamp = int(email.utils.mktime_tz(email.utils.parsedate_tz(key.last_modified)))
+            os.utime(path, (modified_stamp, modified_stamp))
+        except Exception:
+            pass
+
+def download_s3file(module, s3, bucket, key, dest, retries, version=None, cache_dir=None):
+    # dest is about to be rewritten, drop its cached digest.
+    clear_etag_cache(cache_dir, dest)
+    if key.size > MULTIPART_THRESHOLD:
+        try:
+            multipart_download(module, bucket, key, dest, retries, version=version)
+        except (s3.provider.storage_copy_error, s3.provider.storage_response_error) as e:
+            module.fail_json(msg= str(e))
+        except SSLError as e:
+            module.fail_json(msg="s3 download failed; %s" % e)
+        except EnvironmentError as e:
+            module.fail_json(msg="Could not write %s: %s" % (dest, e))
+        module.exit_json(msg="GET operation complete", changed=True)
     # retries is the number of loops; range/xrange needs to be one
     # more to get that count of loops.
-    bucket = s3.lookup(bucket)
-    key = bucket.get_key(obj, version_id=version)
     for x in range(0, retries + 1):
+        # The body is written to a temporary file that replaces dest once
+        # complete, so a failed attempt leaves dest untouched and a hash still
+        # reading dest is never mixed with the new content.
+        tmp_dest = None
         try:
-            key.get_contents_to_filename(dest)
+            real_dest, fd, tmp_dest = mkstemp_beside(dest)
+            os.close(fd)
+            key.get_contents_to_filename(tmp_dest)
+            module.atomic_move(tmp_dest, real_dest)
+            # boto hashes the body while writing it out; caching that digest
+            # saves reading dest back on the next comparison.
+            local_md5 = getattr(key, 'local_hashes', {}).get('md5')
+            if local_md5:
+                save_etag_cache(cache_dir, dest, binascii.hexlify(local_md5).decode('ascii'), stat_signature(os.stat(dest)))
             module.exit_json(msg="GET operation complete", changed=True)
         except s3.provider.storage_copy_error as e:
             module.fail_json(msg= str(e))
@@ -391,51 +879,95 @@ def download_s3file(module, s3, bucket, obj, dest, retries, version=None):
             # actually fail on last pass through the loop.
             if x >= retries:
                 module.fail_json(msg="s3 download failed; %s" % e)
-            # otherwise, try again, this may be a transient timeout.
-            pass
-
-def download_s3str(module, s3, bucket, obj, version=None):
+            # otherwise, try again, this may be a transient timeout. Closing
+            # the key drops the half read key.resp, which the retry would
+            # otherwise keep reading instead of sending a new GET.
+            key.close(fast=True)
+        except EnvironmentError as e:
+            module.fail_json(msg="Could not write %s: %s" % (dest, e))
+        finally:
+            if tmp_dest is not None and os.path.exists(tmp_dest):
+                os.remove(tmp_dest)
+
+def download_s3str(module, s3, key):
     try:
-        bucket = s3.lookup(bucket)
-        key = bucket.get_key(obj, version_id=version)
         contents = key.get_contents_as_string()
         module.exit_json(msg="GET operation complete", contents=contents, changed=True)
     except s3.provider.storage_copy_error as e:
         module.fail_json(msg= str(e))
 
-def get_download_url(module, s3, bucket, obj, expiry, changed=True):
+def get_download_url(module, s3, key, expiry, changed=True):
     try:
-        bucket = s3.lookup(bucket)
-        key = bucket.lookup(obj)
         url = key.generate_url(expiry)
         module.exit_json(msg="Download url:", url=url, expiry=expiry, changed=changed)
     except s3.provider.storage_response_error as e:
         module.fail_json(msg= str(e))
 
-def is_fakes3(s3_url):
-    """ Return True if s3_url has scheme fakes3:// """
-    if s3_url is not None:
-        return urlparse.urlparse(s3_url).scheme in ('fakes3', 'fakes3s')
+def is_fakes3(parsed_s3_url):
+    """ Return True if the parsed s3_url has scheme fakes3:// """
+    if parsed_s3_url is not None:
+        return parsed_s3_url.scheme in ('fakes3', 'fakes3s')
     else:
         return False
 
-def is_walrus(s3_url):
+def is_walrus(parsed_s3_url):
     """ Return True if it's Walrus endpoint, not S3
 
     We assume anything other than *.amazonaws.com is Walrus"""
-    if s3_url is not None:
-        o = urlparse.urlparse(s3_url)
-        return not o.hostname.endswith('amazonaws.com')
+    if parsed_s3_url is not None:
+        return not parsed_s3_url.hostname.endswith('amazonaws.com')
     else:
         return False
 
 
+def get_s3_connection(module, aws_connect_kwargs, location, rgw, parsed_s3_url):
+    # Look at s3_url and tweak connection settings
+    # if connecting to RGW, Walrus or fakes3
+    try:
+        if parsed_s3_url and rgw:
+            s3 = boto.connect_s3(
+                is_secure=parsed_s3_url.scheme == 'https',
+                host=parsed_s3_url.hostname,
+                port=parsed_s3_url.port,
+                calling_format=OrdinaryCallingFormat(),
+                **aws_connect_kwargs
+            )
+        elif is_fakes3(parsed_s3_url):
+            s3 = S3Connection(
+                is_secure=parsed_s3_url.scheme == 'fakes3s',
+                host=parsed_s3_url.hostname,
+                port=parsed_s3_url.port,
+                calling_format=OrdinaryCallingFormat(),
+                **aws_connect_kwargs
+            )
+        elif is_walrus(parsed_s3_url):
+            s3 = boto.connect_walrus(parsed_s3_url.hostname, **aws_connect_kwargs)
+        else:
+            aws_connect_kwargs['is_secure'] = True
+            try:
+                s3 = connect_to_aws(boto.s3, location, **aws_connect_kwargs)
+            except AnsibleAWSError:
+                # use this as fallback because connect_to_region seems to fail in boto + non 'classic' aws accounts in some cases
+                s3 = boto.connect_s3(**aws_connect_kwargs)
+
+    except boto.exception.NoAuthHandlerFound as e:
+        module.fail_json(msg='No Authentication Handler found: %s ' % str(e))
+    except Exception as e:
+        module.fail_json(msg='Failed to connect to S3: %s' % str(e))
+
+    if s3 is None: # this should never happen
+        module.fail_json(msg ='Unknown error, failed to create s3 connection, no information from boto.')
+
+    return s3
+
+
 def main():
     argument_spec = ec2_argument_spec()
     argument_spec.update(dict(
             bucket         = dict(required=True),
             dest           = dict(default=None),
             encrypt        = dict(default=True, type='bool'),
+            etag_cache_dir = dict(type='path'),
             expiry         = dict(default=600, aliases=['expiration']),
             headers        = dict(type='dict'),
             marker         = dict(default=None),
@@ -460,9 +992,11 @@ def main():
 
     bucket = module.params.get('bucket')
     encrypt = module.params.get('encrypt')
+    etag_cache_dir = module.params.get('etag_cache_dir')
     expiry = int(module.params['expiry'])
-    if module.params.get('dest'):
-        dest = os.path.expanduser(module.params.get('dest'))
+    dest = module.params.get('dest')
+    if dest:
+        dest = os.path.expanduser(dest)
     headers = module.params.get('headers')
     marker = module.params.get('marker')
     max_keys = module.params.get('max_keys')
@@ -487,6 +1021,10 @@ def main():
         else:
             overwrite = 'never'
 
+    # Only a comparison reads the etag cache, do not write it otherwise.
+    if overwrite == 'always':
+        etag_cache_dir = None
+
     region, ec2_url, aws_connect_kwargs = get_aws_connection_info(module)
 
     if region in ('us-east-1', '', None):
@@ -508,62 +1046,76 @@ def main():
     if rgw and not s3_url:
         module.fail_json(msg='rgw flavour requires s3_url')
 
+    if s3_url:
+        parsed_s3_url = urlparse(s3_url)
+    else:
+        parsed_s3_url = None
+
     # bucket names with .'s in them need to use the calling_format option,
     # otherwise the connection will fail. See https://github.com/boto/boto/issues/2836
     # for more details.
     if '.' in bucket:
         aws_connect_kwargs['calling_format'] = OrdinaryCallingFormat()
 
-    # Look at s3_url and tweak connection settings
-    # if connecting to RGW, Walrus or fakes3
-    try:
-        if s3_url and rgw:
-            rgw = urlparse.urlparse(s3_url)
-            s3 = boto.connect_s3(
-                is_secure=rgw.scheme == 'https',
-                host=rgw.hostname,
-                port=rgw.port,
-                calling_format=OrdinaryCallingFormat(),
-                **aws_connect_kwargs
-            )
-        elif is_fakes3(s3_url):
-            fakes3 = urlparse.urlparse(s3_url)
-            s3 = S3Connection(
-                is_secure=fakes3.scheme == 'fakes3s',
-                host=fakes3.hostname,
-                port=fakes3.port,
-                calling_format=OrdinaryCallingFormat(),
-                **aws_connect_kwargs
-            )
-        elif is_walrus(s3_url):
-            walrus = urlparse.urlparse(s3_url).hostname
-            s3 = boto.connect_walrus(walrus, **aws_connect_kwargs)
+    s3 = get_s3_connection(module, aws_connect_kwargs, location, rgw, parsed_s3_url)
+
+    if mode == 'create' and obj:
+        dirobj = obj if obj.endswith('/') else obj + '/'
+
+        # AWS honours the conditional PUT in create_dirkey, so try it before
+        # anything else. Only when it fails (missing bucket, other region) are
+        # the bucket and key probed below. Other S3 implementations may ignore
+        # the condition and are always probed first.
+        if not s3_url:
+            create_dirkey(module, s3, s3.get_bucket(bucket, validate=False), dirobj, fail_on_error=False)
+
+    # Check the bucket and the key the mode works on together, every mode
+    # below works on the returned objects.
+    if mode in ('get', 'getstr'):
+        key_name, key_version = obj, version
+    elif mode in ('put', 'geturl'):
+        key_name, key_version = obj, None
+    elif mode == 'create' and obj:
+        key_name, key_version = dirobj, None
+    else:
+        key_name, key_version = None, None
+
+    # When an existing local file is going to be compared with the key, hash
+    # it while the key is looked up. Only files up to MULTIPART_THRESHOLD are
+    # hashed ahead: this module uploads them in a single PUT, which gives them
+    # a plain MD5 etag. Larger ones get a multipart etag that needs its own
+    # hashing once the remote etag is known.
+    pending_md5 = None
+    if overwrite != 'always' and mode in ('get', 'put'):
+        if mode == 'get':
+            local_file = dest
         else:
-            aws_connect_kwargs['is_secure'] = True
-            try:
-                s3 = connect_to_aws(boto.s3, location, **aws_connect_kwargs)
-            except AnsibleAWSError:
-                # use this as fallback because connect_to_region seems to fail in boto + non 'classic' aws accounts in some cases
-                s3 = boto.connect_s3(**aws_connect_kwargs)
+            local_file = src
+        if local_file and os.path.isfile(local_file) and os.path.getsize(local_file) <= MULTIPART_THRESHOLD:
+            pending_md5 = start_md5_digest(local_file, etag_cache_dir)
 
-    except boto.exception.NoAuthHandlerFound as e:
-        module.fail_json(msg='No Authentication Handler found: %s ' % str(e))
-    except Exception as e:
-        module.fail_json(msg='Failed to connect to S3: %s' % str(e))
+    bucket_obj, key, bucket_region = bucket_and_key_check(module, s3, bucket, key_name, version=key_version)
 
-    if s3 is None: # this should never happen
-        module.fail_json(msg ='Unknown error, failed to create s3 connection, no information from boto.')
+    # A bucket living outside the connected region cannot be found here, S3
+    # reports where it is instead. Reconnect to that region once.
+    if bucket_obj is None:
+        new_location = reconnect_location(location, bucket_region, s3_url)
+        if new_location is not None:
+            location = new_location
+            s3 = get_s3_connection(module, aws_connect_kwargs, location, rgw, parsed_s3_url)
+            bucket_obj, key, bucket_region = bucket_and_key_check(module, s3, bucket, key_name, version=key_version)
+
+    bucketrtn = bucket_obj is not None
+    keyrtn = key is not None
 
     # If our mode is a GET operation (download), go through the procedure as appropriate ...
     if mode == 'get':
 
         # First, we check to see if the bucket exists, we get "bucket" returned.
-        bucketrtn = bucket_check(module, s3, bucket)
         if bucketrtn is False:
             module.fail_json(msg="Source bucket cannot be found", failed=True)
 
         # Next, we check to see if the key in the bucket exists. If it exists, it also returns key_matches md5sum check.
-        keyrtn = key_check(module, s3, bucket, obj, version=version)
         if keyrtn is False:
             if version is not None:
                 module.fail_json(msg="Key %s with version id %s does not exist."% (obj, version), failed=True)
@@ -571,27 +1123,26 @@ def main():
                 module.fail_json(msg="Key %s does not exist."%obj, failed=True)
 
         # If the destination path doesn't exist or overwrite is True, no need to do the md5um etag check, so just download.
-        pathrtn = path_check(dest)
+        pathrtn = os.path.exists(dest)
         if pathrtn is False or overwrite == 'always':
-            download_s3file(module, s3, bucket, obj, dest, retries, version=version)
+            download_s3file(module, s3, bucket_obj, key, dest, retries, version=version, cache_dir=etag_cache_dir)
 
         # Compare the remote MD5 sum of the object with the local dest md5sum, if it already exists.
         if pathrtn is True:
-            md5_remote = keysum(module, s3, bucket, obj, version=version)
-            md5_local = module.md5(dest)
-            if md5_local == md5_remote:
-                sum_matches = True
+            if os.path.isdir(dest):
+                module.fail_json(msg="attempted to take checksum of directory: %s" % dest)
+            sum_matches = compare_local(key, dest, pending_md5, etag_cache_dir)
+            if sum_matches:
                 if overwrite == 'always':
-                    download_s3file(module, s3, bucket, obj, dest, retries, version=version)
+                    download_s3file(module, s3, bucket_obj, key, dest, retries, version=version, cache_dir=etag_cache_dir)
                 else:
+                    drop_page_cache(dest)
                     module.exit_json(msg="Local and remote object are identical, ignoring. Use overwrite=always parameter to force.", changed=False)
+            elif overwrite in ('always', 'different'):
+                download_s3file(module, s3, bucket_obj, key, dest, retries, version=version, cache_dir=etag_cache_dir)
             else:
-                sum_matches = False
-
-                if overwrite in ('always', 'different'):
-                    download_s3file(module, s3, bucket, obj, dest, retries, version=version)
-                else:
-                    module.exit_json(msg="WARNING: Checksums do not match. Use overwrite parameter to force download.")
+                drop_page_cache(dest)
+                module.exit_json(msg="WARNING: Checksums do not match. Use overwrite parameter to force download.")
 
         # Firstly, if key_matches is TRUE and overwrite is not enabled, we EXIT with a helpful message.
         if sum_matches is True and overwrite == 'never':
@@ -604,50 +1155,43 @@ def main():
 #       module.exit_json(msg="Bucket return %s"%bucketrtn)
 
         # Lets check the src path.
-        pathrtn = path_check(src)
+        pathrtn = os.path.exists(src)
         if pathrtn is False:
             module.fail_json(msg="Local object for PUT does not exist", failed=True)
 
-        # Lets check to see if bucket exists to get ground truth.
-        bucketrtn = bucket_check(module, s3, bucket)
-        if bucketrtn is True:
-            keyrtn = key_check(module, s3, bucket, obj)
-
         # Lets check key state. Does it exist and if it does, compute the etag md5sum.
         if bucketrtn is True and keyrtn is True:
-                md5_remote = keysum(module, s3, bucket, obj)
-                md5_local = module.md5(src)
-
-                if md5_local == md5_remote:
-                    sum_matches = True
+                if os.path.isdir(src):
+                    module.fail_json(msg="attempted to take checksum of directory: %s" % src)
+                sum_matches = compare_local(key, src, pending_md5, etag_cache_dir)
+                if sum_matches:
                     if overwrite == 'always':
-                        upload_s3file(module, s3, bucket, obj, src, expiry, metadata, encrypt, headers)
+                        upload_s3file(module, s3, bucket_obj, obj, src, expiry, metadata, encrypt, headers)
                     else:
-                        get_download_url(module, s3, bucket, obj, expiry, changed=False)
+                        drop_page_cache(src)
+                        get_download_url(module, s3, key, expiry, changed=False)
+                elif overwrite in ('always', 'different'):
+                    upload_s3file(module, s3, bucket_obj, obj, src, expiry, metadata, encrypt, headers)
                 else:
-                    sum_matches = False
-                    if overwrite in ('always', 'different'):
-                        upload_s3file(module, s3, bucket, obj, src, expiry, metadata, encrypt, headers)
-                    else:
-                        module.exit_json(msg="WARNING: Checksums do not match. Use overwrite parameter to force upload.")
+                    drop_page_cache(src)
+                    module.exit_json(msg="WARNING: Checksums do not match. Use overwrite parameter to force upload.")
 
         # If neither exist (based on bucket existence), we can create both.
         if bucketrtn is False and pathrtn is True:
-            create_bucket(module, s3, bucket, location)
-            upload_s3file(module, s3, bucket, obj, src, expiry, metadata, encrypt, headers)
+            bucket_obj = create_bucket(module, s3, bucket, location)
+            upload_s3file(module, s3, bucket_obj, obj, src, expiry, metadata, encrypt, headers)
 
         # If bucket exists but key doesn't, just upload.
         if bucketrtn is True and pathrtn is True and keyrtn is False:
-            upload_s3file(module, s3, bucket, obj, src, expiry, metadata, encrypt, headers)
+            upload_s3file(module, s3, bucket_obj, obj, src, expiry, metadata, encrypt, headers)
 
     # Delete an object from a bucket, not the entire bucket
     if mode == 'delobj':
         if obj is None:
             module.fail_json(msg="object parameter is required", failed=True);
         if bucket:
-            bucketrtn = bucket_check(module, s3, bucket)
             if bucketrtn is True:
-                deletertn = delete_key(module, s3, bucket, obj)
+                deletertn = delete_key(module, s3, bucket_obj, obj)
                 if deletertn is True:
                     module.exit_json(msg="Object %s deleted from bucket %s." % (obj, bucket), changed=True)
             else:
@@ -659,9 +1203,8 @@ def main():
     # Delete an entire bucket, including all objects in the bucket
     if mode == 'delete':
         if bucket:
-            bucketrtn = bucket_check(module, s3, bucket)
             if bucketrtn is True:
-                deletertn = delete_bucket(module, s3, bucket)
+                deletertn = delete_bucket(module, s3, bucket_obj)
                 if deletertn is True:
                     module.exit_json(msg="Bucket %s and all keys have been deleted."%bucket, changed=True)
             else:
@@ -671,49 +1214,40 @@ def main():
 
     # Support for listing a set of keys
     if mode == 'list':
-        bucket_object = get_bucket(module, s3, bucket)
 
         # If the bucket does not exist then bail out
-        if bucket_object is None:
+        if bucket_obj is None:
             module.fail_json(msg="Target bucket (%s) cannot be found"% bucket, failed=True)
 
-        list_keys(module, bucket_object, prefix, marker, max_keys)
+        list_keys(module, bucket_obj, prefix, marker, max_keys)
 
     # Need to research how to create directories without "populating" a key, so this should just do bucket creation for now.
     # WE SHOULD ENABLE SOME WAY OF CREATING AN EMPTY KEY TO CREATE "DIRECTORY" STRUCTURE, AWS CONSOLE DOES THIS.
     if mode == 'create':
         if bucket and not obj:
-            bucketrtn = bucket_check(module, s3, bucket)
             if bucketrtn is True:
                 module.exit_json(msg="Bucket already exists.", changed=False)
             else:
-                module.exit_json(msg="Bucket created successfully", changed=create_bucket(module, s3, bucket, location))
+                create_bucket(module, s3, bucket, location)
+                module.exit_json(msg="Bucket created successfully", changed=True)
         if bucket and obj:
-            bucketrtn = bucket_check(module, s3, bucket)
-            if obj.endswith('/'):
-                dirobj = obj
-            else:
-                dirobj = obj + "/"
             if bucketrtn is True:
-                keyrtn = key_check(module, s3, bucket, dirobj)
                 if keyrtn is True:
-                    module.exit_json(msg="Bucket %s and key %s already exists."% (bucket, obj), changed=False)
+                    module.exit_json(msg="Bucket %s and key %s already exists."% (bucket, dirobj), changed=False)
                 else:
-                    create_dirkey(module, s3, bucket, dirobj)
+                    create_dirkey(module, s3, bucket_obj, dirobj)
             if bucketrtn is False:
-                created = create_bucket(module, s3, bucket, location)
-                create_dirkey(module, s3, bucket, dirobj)
+                bucket_obj = create_bucket(module, s3, bucket, location)
+                create_dirkey(module, s3, bucket_obj, dirobj)
 
     # Support for grabbing the time-expired URL for an object in S3/Walrus.
     if mode == 'geturl':
         if bucket and obj:
-            bucketrtn = bucket_check(module, s3, bucket)
             if bucketrtn is False:
                 module.fail_json(msg="Bucket %s does not exist."%bucket, failed=True)
             else:
-                keyrtn = key_check(module, s3, bucket, obj)
                 if keyrtn is True:
-                    get_download_url(module, s3, bucket, obj, expiry)
+                    get_download_url(module, s3, key, expiry)
                 else:
                     module.fail_json(msg="Key %s does not exist."%obj, failed=True)
         else:
@@ -721,13 +1255,11 @@ def main():
 
     if mode == 'getstr':
         if bucket and obj:
-            bucketrtn = bucket_check(module, s3, bucket)
             if bucketrtn is False:
                 module.fail_json(msg="Bucket %s does not exist."%bucket, failed=True)
             else:
-                keyrtn = key_check(module, s3, bucket, obj, version=version)
                 if keyrtn is True:
-                    download_s3str(module, s3, bucket, obj, version=version)
+                    download_s3str(module, s3, key)
                 else:
                     if version is not None:
                         module.fail_json(msg="Key %s with version id %s does not exist."% (obj, version), failed=True)
@@ -0,0 +1,555 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from ansible.compat.tests.mock import MagicMock, patch
+
+import ansible.modules.cloud.amazon.s3 as s3
+
+MIB = 1024 * 1024
+
+
+def write_file(path, data):
+    f = open(path, 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+
+
+def read_file(path):
+    f = open(path, 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def make_module():
+    # exit_json and fail_json end the run, as they do in AnsibleModule
+    module = MagicMock()
+    module.exit_json.side_effect = SystemExit
+    module.fail_json.side_effect = SystemExit
+    return module
+
+
+class S3ResponseError(Exception):
+
+    def __init__(self, status, reason='', body=''):
+        Exception.__init__(self, status, reason)
+        self.status = status
+
+
+def make_connection():
+    s3_conn = MagicMock()
+    s3_conn.provider.storage_response_error = S3ResponseError
+    return s3_conn
+
+
+def multipart_etag(data, chunk_size):
+    digests = [hashlib.md5(data[i:i + chunk_size]).digest() for i in range(0, len(data), chunk_size)]
+    return '%s-%d' % (hashlib.md5(b''.join(digests)).hexdigest(), len(digests))
+
+
+class AnsibleS3EtagCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.path = os.path.join(self.tmpdir, 'object')
+        write_file(self.path, b'hello')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def save(self, etag):
+        s3.save_etag_cache(self.cache_dir, self.path, etag, s3.stat_signature(os.stat(self.path)))
+
+    def test_save_and_load(self):
+        self.save('abc')
+        cached = s3.load_etag_cache(self.cache_dir, self.path)
+        self.assertEqual(cached[:4], s3.stat_signature(os.stat(self.path)))
+        self.assertEqual(cached[4], ['abc'])
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), ['abc'])
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['cache', 'object'])
+
+    def test_disabled(self):
+        s3.save_etag_cache(None, self.path, 'abc', s3.stat_signature(os.stat(self.path)))
+        self.assertEqual(os.listdir(self.tmpdir), ['object'])
+        self.assertEqual(s3.get_cached_etags(None, self.path), [])
+        self.assertEqual(s3.cached_md5_digest(self.path), hashlib.md5(b'hello').hexdigest())
+        self.assertEqual(os.listdir(self.tmpdir), ['object'])
+
+    def test_load_missing(self):
+        self.assertEqual(s3.load_etag_cache(self.cache_dir, self.path), None)
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), [])
+
+    def test_load_corrupt(self):
+        os.mkdir(self.cache_dir)
+        write_file(s3.etag_cache_file(self.cache_dir, self.path), b'[1, 2')
+        self.assertEqual(s3.load_etag_cache(self.cache_dir, self.path), None)
+        write_file(s3.etag_cache_file(self.cache_dir, self.path), b'[1, 2, "abc"]')
+        self.assertEqual(s3.load_etag_cache(self.cache_dir, self.path), None)
+        write_file(s3.etag_cache_file(self.cache_dir, self.path), b'[1, 2, 3, 4, 5]')
+        self.assertEqual(s3.load_etag_cache(self.cache_dir, self.path), None)
+
+    def test_load_foreign_owner(self):
+        self.save('abc')
+        with patch.object(s3.os, 'getuid', return_value=os.getuid() + 1):
+            self.assertEqual(s3.load_etag_cache(self.cache_dir, self.path), None)
+            self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), [])
+
+    def test_save_replaces_link(self):
+        os.mkdir(self.cache_dir)
+        target = os.path.join(self.tmpdir, 'target')
+        write_file(target, b'keep')
+        os.symlink(target, s3.etag_cache_file(self.cache_dir, self.path))
+        self.save('abc')
+        self.assertFalse(os.path.islink(s3.etag_cache_file(self.cache_dir, self.path)))
+        self.assertEqual(read_file(target), b'keep')
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), ['abc'])
+
+    def test_save_changed_while_hashing(self):
+        signature = s3.stat_signature(os.stat(self.path))
+        write_file(self.path, b'hello world')
+        s3.save_etag_cache(self.cache_dir, self.path, 'abc', signature)
+        self.assertEqual(s3.load_etag_cache(self.cache_dir, self.path), None)
+
+    def test_md5_changed_while_hashing(self):
+        def get_md5_digest(local_file):
+            write_file(local_file, b'hello world')
+            return hashlib.md5(b'hello').hexdigest()
+        with patch.object(s3, 'get_md5_digest', side_effect=get_md5_digest):
+            s3.cached_md5_digest(self.path, self.cache_dir)
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), [])
+
+    def test_clear(self):
+        self.save('abc')
+        s3.clear_etag_cache(self.cache_dir, self.path)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        s3.clear_etag_cache(self.cache_dir, self.path)
+
+    def test_invalidated_by_size(self):
+        self.save('abc')
+        write_file(self.path, b'hello world')
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), [])
+
+    def test_invalidated_by_replacement(self):
+        self.save('abc')
+        st = os.stat(self.path)
+        other = os.path.join(self.tmpdir, 'other')
+        write_file(other, b'jello')
+        os.utime(other, (st.st_atime, st.st_mtime))
+        os.rename(other, self.path)
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), [])
+
+    def test_md5_keeps_multipart_cache(self):
+        md5 = hashlib.md5(b'hello').hexdigest()
+        self.save('abc-2')
+        self.assertEqual(s3.cached_md5_digest(self.path, self.cache_dir), md5)
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), [md5, 'abc-2'])
+        with patch.object(s3, 'get_md5_digest') as get_md5_digest:
+            self.assertEqual(s3.cached_md5_digest(self.path, self.cache_dir), md5)
+            self.assertFalse(get_md5_digest.called)
+        self.save('def-2')
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), ['def-2', md5])
+
+    def test_save_drops_stale_etags(self):
+        self.save('abc-2')
+        write_file(self.path, b'hello world')
+        self.save('abc')
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), ['abc'])
+
+
+class AnsibleS3EtagFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.path = os.path.join(self.tmpdir, 'object')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_multipart_etags(self):
+        data = os.urandom(1000)
+        write_file(self.path, data)
+        etags = s3.get_multipart_etags(self.path, [3, 64, 1000, 4096])
+        self.assertEqual(etags[3], multipart_etag(data, 3))
+        self.assertEqual(etags[64], multipart_etag(data, 64))
+        self.assertEqual(etags[1000], multipart_etag(data, 1000))
+        self.assertEqual(etags[4096], multipart_etag(data, 4096))
+
+    def test_get_multipart_etags_across_blocks(self):
+        data = os.urandom(s3.DIGEST_BLOCKSIZE + 3 * MIB)
+        write_file(self.path, data)
+        etags = s3.get_multipart_etags(self.path, [5 * MIB])
+        self.assertEqual(etags[5 * MIB], multipart_etag(data, 5 * MIB))
+
+    def test_multipart_chunk_sizes(self):
+        self.assertEqual(s3.multipart_chunk_sizes(150000000, 'abc-3'), [64 * MIB, 48 * MIB])
+        self.assertEqual(s3.multipart_chunk_sizes(20 * MIB, 'abc-4'), [5 * MIB])
+        self.assertEqual(s3.multipart_chunk_sizes(20 * MIB, 'abc-7'), [3 * MIB])
+        self.assertEqual(s3.multipart_chunk_sizes(20 * MIB, 'abc-1000'), [])
+        self.assertEqual(s3.multipart_chunk_sizes(8 * MIB, 'abc-1'), [64 * MIB])
+        self.assertEqual(s3.multipart_chunk_sizes(100 * MIB, 'abc-1'), [128 * MIB])
+
+    def test_multipart_chunk_sizes_bad_etag(self):
+        self.assertEqual(s3.multipart_chunk_sizes(20 * MIB, 'abc-xyz'), [])
+        write_file(self.path, b'hello')
+        self.assertEqual(s3.local_etag(self.path, 'abc-xyz'), None)
+
+    def test_local_etag(self):
+        data = os.urandom(6 * MIB + 1)
+        write_file(self.path, data)
+        remote_etag = multipart_etag(data, 5 * MIB)
+        self.assertEqual(s3.local_etag(self.path, remote_etag, cache_dir=self.cache_dir), remote_etag)
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), [remote_etag])
+        self.assertEqual(s3.local_etag(self.path, multipart_etag(data[::-1], 5 * MIB), cache_dir=self.cache_dir), None)
+
+    def test_local_etag_cached_with_md5(self):
+        data = os.urandom(6 * MIB + 1)
+        write_file(self.path, data)
+        remote_etag = multipart_etag(data, 5 * MIB)
+        with patch.object(s3, 'get_md5_digest', wraps=s3.get_md5_digest) as get_md5_digest:
+            with patch.object(s3, 'get_multipart_etags', wraps=s3.get_multipart_etags) as get_multipart_etags:
+                for x in range(3):
+                    pending_md5 = s3.start_md5_digest(self.path, self.cache_dir)
+                    self.assertEqual(s3.local_etag(self.path, remote_etag, pending_md5, self.cache_dir), remote_etag)
+                    pending_md5.wait()
+        self.assertEqual(get_md5_digest.call_count, 1)
+        self.assertEqual(get_multipart_etags.call_count, 1)
+
+    def test_local_etag_md5(self):
+        write_file(self.path, b'hello')
+        md5 = hashlib.md5(b'hello').hexdigest()
+        self.assertEqual(s3.local_etag(self.path, md5, cache_dir=self.cache_dir), md5)
+        self.assertEqual(s3.get_cached_etags(self.cache_dir, self.path), [md5])
+
+
+@patch.object(s3, 'MULTIPART_CHUNKSIZE', 4)
+class AnsibleS3MultipartUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, 'object.txt')
+        write_file(self.src, b'0123456789')
+        self.bucket = MagicMock()
+        self.mp = self.bucket.initiate_multipart_upload.return_value
+        self.parts = {}
+        self.mp.upload_part_from_file.side_effect = self.upload_part
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def upload_part(self, fp, part_num, size=None):
+        self.parts[part_num] = (fp.tell(), fp.read(size))
+
+    def test_parts(self):
+        headers = {'x-amz-meta-a': 'b'}
+        s3.multipart_upload(self.bucket, 'object.txt', self.src, None, True, headers)
+        self.assertEqual(self.parts, {1: (0, b'0123'), 2: (4, b'4567'), 3: (8, b'89')})
+        self.mp.complete_upload.assert_called_once_with()
+        self.assertFalse(self.mp.cancel_upload.called)
+        self.bucket.initiate_multipart_upload.assert_called_once_with(
+            'object.txt', headers={'x-amz-meta-a': 'b', 'Content-Type': 'text/plain'}, metadata=None, encrypt_key=True)
+        self.assertEqual(headers, {'x-amz-meta-a': 'b'})
+
+    def test_content_type_given(self):
+        s3.multipart_upload(self.bucket, 'object.txt', self.src, {'Content-Type': 'text/csv'}, False, None)
+        self.bucket.initiate_multipart_upload.assert_called_once_with(
+            'object.txt', headers={}, metadata={'Content-Type': 'text/csv'}, encrypt_key=False)
+
+    def test_failed_part_cancels(self):
+        def upload_part(fp, part_num, size=None):
+            if part_num == 2:
+                raise IOError('connection reset')
+        self.mp.upload_part_from_file.side_effect = upload_part
+        self.assertRaises(IOError, s3.multipart_upload, self.bucket, 'object.txt', self.src, None, False, None)
+        self.mp.cancel_upload.assert_called_once_with()
+        self.assertFalse(self.mp.complete_upload.called)
+
+    def test_failed_cancel_keeps_error(self):
+        self.mp.upload_part_from_file.side_effect = IOError('connection reset')
+        self.mp.cancel_upload.side_effect = ValueError('cancel failed')
+        self.assertRaises(IOError, s3.multipart_upload, self.bucket, 'object.txt', self.src, None, False, None)
+        self.mp.cancel_upload.assert_called_once_with()
+
+
+@patch.object(s3, 'MULTIPART_CHUNKSIZE', 4)
+class AnsibleS3MultipartDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dest = os.path.join(self.tmpdir, 'object')
+        self.data = b'0123456789'
+        self.headers = []
+        self.fail_range = None
+        self.bucket = MagicMock()
+        self.bucket.new_key.side_effect = self.new_key
+        self.key = MagicMock(size=len(self.data), etag='"etag"', last_modified='Wed, 01 Jan 2020 00:00:00 GMT')
+        self.key.name = 'object'
+        self.module = MagicMock()
+        self.module.atomic_move.side_effect = os.rename
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def new_key(self, name):
+        key = MagicMock()
+        key.get_contents_to_file.side_effect = self.get_contents_to_file
+        return key
+
+    def get_contents_to_file(self, fp, headers=None, version_id=None):
+        self.headers.append(headers)
+        if headers['Range'] == self.fail_range:
+            raise IOError('connection reset')
+        start, end = headers['Range'][len('bytes='):].split('-')
+        fp.write(self.data[int(start):int(end) + 1])
+
+    def test_ranges(self):
+        s3.multipart_download(self.module, self.bucket, self.key, self.dest, 0)
+        self.assertEqual(sorted(h['Range'] for h in self.headers), ['bytes=0-3', 'bytes=4-7', 'bytes=8-9'])
+        self.assertEqual([h['If-Match'] for h in self.headers], ['"etag"'] * 3)
+        self.assertEqual(read_file(self.dest), self.data)
+        self.assertEqual(os.stat(self.dest).st_mtime, 1577836800)
+        self.assertEqual(os.listdir(self.tmpdir), ['object'])
+
+    def test_failed_part_keeps_dest(self):
+        write_file(self.dest, b'old')
+        self.fail_range = 'bytes=4-7'
+        self.assertRaises(IOError, s3.multipart_download, self.module, self.bucket, self.key, self.dest, 0)
+        self.assertEqual(read_file(self.dest), b'old')
+        self.assertEqual(os.listdir(self.tmpdir), ['object'])
+        self.assertFalse(self.module.atomic_move.called)
+
+    def test_symlinked_dest(self):
+        target = os.path.join(self.tmpdir, 'target')
+        write_file(target, b'old')
+        os.symlink(target, self.dest)
+        s3.multipart_download(self.module, self.bucket, self.key, self.dest, 0)
+        self.assertTrue(os.path.islink(self.dest))
+        self.assertEqual(read_file(target), self.data)
+
+
+
+class AnsibleS3Download(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dest = os.path.join(self.tmpdir, 'object')
+        self.module = make_module()
+        self.module.atomic_move.side_effect = os.rename
+        self.s3 = make_connection()
+        self.s3.provider.storage_copy_error = S3ResponseError
+        self.key = MagicMock(size=10, local_hashes={})
+        self.failures = 0
+        self.key.get_contents_to_filename.side_effect = self.get_contents_to_filename
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_contents_to_filename(self, filename):
+        if self.failures:
+            self.failures -= 1
+            write_file(filename, b'01234')
+            raise s3.SSLError('read timed out')
+        write_file(filename, b'0123456789')
+
+    def test_replaces_dest(self):
+        write_file(self.dest, b'old')
+        self.assertRaises(SystemExit, s3.download_s3file, self.module, self.s3, None, self.key, self.dest, 0)
+        self.assertEqual(read_file(self.dest), b'0123456789')
+        self.assertEqual(os.listdir(self.tmpdir), ['object'])
+        self.module.exit_json.assert_called_once_with(msg="GET operation complete", changed=True)
+
+    def test_caches_md5(self):
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        md5 = hashlib.md5(b'0123456789')
+        self.key.local_hashes = {'md5': md5.digest()}
+        self.key.etag = '"%s"' % md5.hexdigest()
+        self.assertRaises(SystemExit, s3.download_s3file, self.module, self.s3, None, self.key, self.dest, 0, cache_dir=cache_dir)
+        self.assertEqual(s3.get_cached_etags(cache_dir, self.dest), [md5.hexdigest()])
+        with patch.object(s3, 'get_md5_digest') as get_md5_digest:
+            self.assertTrue(s3.compare_local(self.key, self.dest, cache_dir=cache_dir))
+            self.assertFalse(get_md5_digest.called)
+
+    def test_retry(self):
+        self.failures = 1
+        self.assertRaises(SystemExit, s3.download_s3file, self.module, self.s3, None, self.key, self.dest, 1)
+        self.key.close.assert_called_once_with(fast=True)
+        self.assertEqual(read_file(self.dest), b'0123456789')
+        self.assertEqual(os.listdir(self.tmpdir), ['object'])
+
+    def test_unwritable(self):
+        write_file(self.dest, b'old')
+        with patch.object(s3.tempfile, 'mkstemp', side_effect=OSError(errno.EACCES, 'Permission denied')):
+            self.assertRaises(SystemExit, s3.download_s3file, self.module, self.s3, None, self.key, self.dest, 0)
+        self.assertIn('Permission denied', self.module.fail_json.call_args[1]['msg'])
+        self.assertFalse(self.key.get_contents_to_filename.called)
+        self.assertEqual(read_file(self.dest), b'old')
+
+    @patch.object(s3, 'MULTIPART_THRESHOLD', 4)
+    def test_multipart_unwritable(self):
+        with patch.object(s3.tempfile, 'mkstemp', side_effect=OSError(errno.ENOSPC, 'No space left on device')):
+            self.assertRaises(SystemExit, s3.download_s3file, self.module, self.s3, None, self.key, self.dest, 0)
+        self.assertIn('No space left on device', self.module.fail_json.call_args[1]['msg'])
+        self.assertFalse(self.module.exit_json.called)
+
+    def test_failed_keeps_dest(self):
+        write_file(self.dest, b'old')
+        self.failures = 1
+        self.assertRaises(SystemExit, s3.download_s3file, self.module, self.s3, None, self.key, self.dest, 0)
+        self.assertTrue(self.module.fail_json.called)
+        self.assertEqual(read_file(self.dest), b'old')
+        self.assertEqual(os.listdir(self.tmpdir), ['object'])
+
+
+@patch.object(s3, 'DELETE_BATCH_SIZE', 3)
+class AnsibleS3DeleteBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.module = make_module()
+        self.s3 = make_connection()
+        self.bucket = MagicMock()
+        self.batches = []
+        self.bucket.delete_keys.side_effect = self.batches.append
+
+    def list_keys(self, count):
+        keys = []
+        for i in range(count):
+            key = MagicMock()
+            key.name = 'key%d' % i
+            keys.append(key)
+        self.bucket.list.return_value = keys
+
+    def test_batches(self):
+        self.list_keys(7)
+        self.assertTrue(s3.delete_bucket(self.module, self.s3, self.bucket))
+        self.assertEqual(sorted(self.batches), [['key0', 'key1', 'key2'], ['key3', 'key4', 'key5'], ['key6']])
+        self.bucket.delete.assert_called_once_with()
+
+    def test_full_batches(self):
+        self.list_keys(6)
+        self.assertTrue(s3.delete_bucket(self.module, self.s3, self.bucket))
+        self.assertEqual(sorted(self.batches), [['key0', 'key1', 'key2'], ['key3', 'key4', 'key5']])
+
+    def test_empty(self):
+        self.list_keys(0)
+        self.assertTrue(s3.delete_bucket(self.module, self.s3, self.bucket))
+        self.assertEqual(self.batches, [])
+        self.bucket.delete.assert_called_once_with()
+
+    def test_failed_batch(self):
+        self.list_keys(7)
+        self.bucket.delete_keys.side_effect = S3ResponseError(403)
+        self.assertRaises(SystemExit, s3.delete_bucket, self.module, self.s3, self.bucket)
+        self.assertTrue(self.module.fail_json.called)
+        self.assertFalse(self.bucket.delete.called)
+
+
+class AnsibleS3BucketAndKeyCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.module = make_module()
+        self.s3 = make_connection()
+        self.bucket = self.s3.get_bucket.return_value
+        self.head_bucket(200)
+
+    def head_bucket(self, status, region=None):
+        response = self.s3.make_request.return_value
+        response.status = status
+        response.getheader.side_effect = {'x-amz-bucket-region': region}.get
+
+    def test_key_found(self):
+        key = self.bucket.get_key.return_value
+        self.assertEqual(s3.bucket_and_key_check(self.module, self.s3, 'bucket', 'key'), (self.bucket, key, None))
+        self.s3.get_bucket.assert_called_once_with('bucket', validate=False)
+        self.assertFalse(self.s3.make_request.called)
+
+    def test_no_key(self):
+        self.assertEqual(s3.bucket_and_key_check(self.module, self.s3, 'bucket'), (self.bucket, None, None))
+        self.s3.make_request.assert_called_once_with('HEAD', 'bucket')
+
+    def test_key_missing(self):
+        self.bucket.get_key.return_value = None
+        self.assertEqual(s3.bucket_and_key_check(self.module, self.s3, 'bucket', 'key'), (self.bucket, None, None))
+        self.s3.make_request.assert_called_once_with('HEAD', 'bucket')
+
+    def test_bucket_missing(self):
+        self.bucket.get_key.return_value = None
+        self.head_bucket(404)
+        self.assertEqual(s3.bucket_and_key_check(self.module, self.s3, 'bucket', 'key'), (None, None, None))
+
+    def test_version_missing(self):
+        self.bucket.get_key.side_effect = S3ResponseError(400)
+        self.assertEqual(s3.bucket_and_key_check(self.module, self.s3, 'bucket', 'key', version='v1'), (self.bucket, None, None))
+
+    def test_bad_request(self):
+        self.bucket.get_key.side_effect = S3ResponseError(400)
+        self.assertRaises(SystemExit, s3.bucket_and_key_check, self.module, self.s3, 'bucket', 'key')
+        self.assertTrue(self.module.fail_json.called)
+
+    def test_other_region(self):
+        self.bucket.get_key.side_effect = S3ResponseError(301)
+        self.head_bucket(301, 'eu-west-1')
+        self.assertEqual(s3.bucket_and_key_check(self.module, self.s3, 'bucket', 'key'), (None, None, 'eu-west-1'))
+        self.s3.make_request.assert_called_once_with('HEAD', 'bucket')
+
+
+
+@patch.object(s3, 'Location', MagicMock(DEFAULT=''), create=True)
+class AnsibleS3ReconnectLocation(unittest.TestCase):
+
+    def test_same_region(self):
+        self.assertEqual(s3.reconnect_location('eu-west-1', 'eu-west-1'), None)
+        self.assertEqual(s3.reconnect_location('', 'us-east-1'), None)
+
+    def test_no_region(self):
+        self.assertEqual(s3.reconnect_location('eu-west-1', None), None)
+
+    def test_other_region(self):
+        self.assertEqual(s3.reconnect_location('', 'eu-west-1'), 'eu-west-1')
+        self.assertEqual(s3.reconnect_location('eu-west-1', 'ap-south-1'), 'ap-south-1')
+
+    def test_us_east_1(self):
+        self.assertEqual(s3.reconnect_location('eu-west-1', 'us-east-1'), '')
+
+    def test_s3_url(self):
+        self.assertEqual(s3.reconnect_location('eu-west-1', 'ap-south-1', 'https://s3.example.com'), None)
+
+
+class AnsibleS3CreateDirkey(unittest.TestCase):
+
+    def setUp(self):
+        self.module = make_module()
+        self.s3 = make_connection()
+        self.bucket = MagicMock()
+        self.bucket.name = 'bucket'
+        self.key = self.bucket.new_key.return_value
+
+    def test_created(self):
+        self.assertRaises(SystemExit, s3.create_dirkey, self.module, self.s3, self.bucket, 'dir/')
+        self.bucket.new_key.assert_called_once_with('dir/')
+        self.key.set_contents_from_string.assert_called_once_with('', headers={'If-None-Match': '*'})
+        self.assertEqual(self.module.exit_json.call_args[1]['changed'], True)
+
+    def test_exists(self):
+        self.key.set_contents_from_string.side_effect = S3ResponseError(412)
+        self.assertRaises(SystemExit, s3.create_dirkey, self.module, self.s3, self.bucket, 'dir/')
+        self.module.exit_json.assert_called_once_with(msg="Bucket %s and key dir/ already exists." % self.bucket.name, changed=False)
+        self.assertFalse(self.module.fail_json.called)
+
+    def test_error(self):
+        self.key.set_contents_from_string.side_effect = S3ResponseError(404)
+        self.assertRaises(SystemExit, s3.create_dirkey, self.module, self.s3, self.bucket, 'dir/')
+        self.assertTrue(self.module.fail_json.called)
+
+    def test_error_ignored(self):
+        self.key.set_contents_from_string.side_effect = S3ResponseError(301)
+        s3.create_dirkey(self.module, self.s3, self.bucket, 'dir/', fail_on_error=False)
+        self.assertFalse(self.module.exit_json.called)
+        self.assertFalse(self.module.fail_json.called)